@@ -1,15 +1,25 @@
+import functools
+import gc
 import io
+import operator
 import os
 import re
-import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Optional, Dict, List
+from itertools import chain, islice
+from typing import BinaryIO, Optional, Dict, List, Union
+from xml.sax.saxutils import escape as xml_escape
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from dateutil import parser as dtparser
 import extract_msg
-import markdown2
-from xhtml2pdf import pisa
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import PageBreak, Paragraph, Preformatted, SimpleDocTemplate
 
 
 # ── Basics ─────────────────────────────────────────────────────────────────────
@@ -19,6 +29,8 @@ st.caption("Drop many Outlook .msg files. Get one combined .txt with full metada
 
 # ── Helpers ────────────────────────────────────────────────────────────────────
 def ensure_str(x) -> str:
+    if type(x) is str:  # fast path: nearly every call is already a str
+        return x
     if x is None:
         return ""
     if isinstance(x, bytes):
@@ -28,37 +40,59 @@ def ensure_str(x) -> str:
             return x.decode("latin-1", "replace")
     return str(x)
 
-def safe_join(sep: str, items) -> str:
-    return sep.join(ensure_str(i) for i in items)
+def _s(obj, attr: str) -> str:
+    # getattr + ensure_str, skipping the conversion when extract_msg already gave a str
+    v = getattr(obj, attr, None)
+    return v if type(v) is str else ensure_str(v or "")
+
+_SAFE_FN_RE = re.compile(r'[<>:"/\\|?*\n\r\t]+')
 
 def safe_filename(name: str, max_len: int = 180) -> str:
-    name = re.sub(r'[<>:"/\\|?*\n\r\t]+', "_", ensure_str(name)).strip().strip(".")
+    name = _SAFE_FN_RE.sub("_", ensure_str(name)).strip().strip(".")
     return name[:max_len] if len(name) > max_len else name
 
+@functools.lru_cache(maxsize=2048)
+def _stringify_addr_seq(items: tuple) -> str:
+    return ", ".join(ensure_str(x).strip() for x in items if ensure_str(x).strip())
+
 def stringify_addrs(v) -> str:
     if v is None:
         return ""
     if isinstance(v, (list, tuple, set)):
-        return ", ".join(ensure_str(x).strip() for x in v if ensure_str(x).strip())
+        # Recipient lists repeat across a thread; memoize on the tuple-ified input
+        try:
+            return _stringify_addr_seq(tuple(v))
+        except TypeError:  # unhashable members
+            return _stringify_addr_seq.__wrapped__(tuple(v))
     return ensure_str(v)
 
+@functools.lru_cache(maxsize=4096)
+def _parse_cached(s: str) -> datetime:
+    # dateutil's parser is slow; the same Date/DateRaw strings recur across a batch
+    return dtparser.parse(s)
+
 def try_parse_datetime(s: Optional[str]) -> Optional[datetime]:
     if not s:
         return None
     try:
-        return dtparser.parse(s)
+        return _parse_cached(s)
     except Exception:
         return None
 
+_MD_ESC = str.maketrans({"|": r"\|", "*": r"\*", "_": r"\_", "`": r"\`"})
+
 def md_inline_escape(text: str) -> str:
-    s = ensure_str(text)
-    # light escape so metadata prints neatly
-    return s.replace("|", r"\|").replace("*", r"\*").replace("_", r"\_").replace("`", r"\`")
+    # light escape so metadata prints neatly (one translate pass, not four replaces)
+    return ensure_str(text).translate(_MD_ESC)
 
 
 # ── Date extraction (compact + robust) ─────────────────────────────────────────
 DATE_BODY_PATTERNS = [r'^\s*sent:\s*(.+)$', r'^\s*date:\s*(.+)$']
 DATE_BODY_COMPILED = [re.compile(p, re.IGNORECASE | re.MULTILINE) for p in DATE_BODY_PATTERNS]
+_DATE_CUT_KEYWORDS = ("subject:", "to:", "from:")
+_DATE_SPLIT_RE = re.compile(r'\b(subject|to|from):', re.IGNORECASE)
+_ANGLE_EMAIL_RE = re.compile(r'<([^>]+@[^>]+)>')
+_ANGLE_STRIP_RE = re.compile(r'\s*<[^>]+>\s*')
 
 def coalesce(*vals) -> str:
     for v in vals:
@@ -67,66 +101,85 @@ def coalesce(*vals) -> str:
             if s: return s
     return ""
 
+@functools.lru_cache(maxsize=2048)
 def normalize_email_pair(display: str, email_field: str) -> tuple[str, str]:
     disp = ensure_str(display) or ""
     eml = ensure_str(email_field).strip()
     if not eml:
-        m = re.search(r'<([^>]+@[^>]+)>', disp)
+        m = _ANGLE_EMAIL_RE.search(disp)
         if m: eml = m.group(1).strip()
     if not disp and eml: disp = eml
-    disp = re.sub(r'\s*<[^>]+>\s*', '', disp).strip() or disp
+    disp = _ANGLE_STRIP_RE.sub('', disp).strip() or disp
     return disp, eml
 
 def parse_date_from_headers(headers: str) -> Optional[str]:
     if not headers: return None
     lines = ensure_str(headers).splitlines()
-    collected, cur = [], None
-    for line in lines:
-        if re.match(r'^[\t ]', line) and cur is not None:
-            cur += " " + line.strip()
-        else:
-            if cur is not None: collected.append(cur)
-            cur = line
-    if cur is not None: collected.append(cur)
-    for line in collected:
-        if line.lower().startswith("date:"):
-            return line.split(":", 1)[1].strip()
+    # Single scan: only the Date header (plus its folded continuation lines) is unfolded
+    for i, line in enumerate(lines):
+        if line[:5].lower() != "date:":
+            continue
+        value = [line[5:]]
+        for cont in lines[i + 1:]:
+            if cont[:1] not in (" ", "\t"): break
+            value.append(cont.strip())
+        return " ".join(value).strip()
     return None
 
+def _keyword_cut(low: str) -> int:
+    # Earliest word-boundary hit of any keyword, -1 if none (plain str.find, no regex)
+    best = -1
+    for kw in _DATE_CUT_KEYWORDS:
+        pos = low.find(kw)
+        while pos > 0 and (low[pos - 1].isalnum() or low[pos - 1] == "_"):
+            pos = low.find(kw, pos + 1)
+        if pos >= 0 and (best < 0 or pos < best):
+            best = pos
+    return best
+
 def parse_date_from_body(body: str) -> Optional[str]:
     if not body: return None
     for pat in DATE_BODY_COMPILED:
         m = pat.search(body)
         if m:
             cand = m.group(1).strip()
-            cand = re.split(r'\b(subject|to|from):', cand, flags=re.IGNORECASE)[0].strip()
+            low = cand.lower()
+            if len(low) == len(cand):
+                cut = _keyword_cut(low)
+                if cut >= 0: cand = cand[:cut].strip()
+            else:  # lower() changed the length (e.g. "İ"), so offsets don't map back
+                cand = _DATE_SPLIT_RE.split(cand)[0].strip()
             if cand: return cand
     return None
 
-def best_effort_parse_datetime(*candidates: Optional[str]) -> tuple[str, str]:
+def best_effort_parse_datetime(*candidates: Optional[str]) -> tuple[str, str, Optional[datetime]]:
     for c in candidates:
         if not c: continue
         try:
-            dt = dtparser.parse(c)
-            return dt.isoformat(), ensure_str(c)
+            dt = _parse_cached(ensure_str(c))
+            return dt.isoformat(), ensure_str(c), dt
         except Exception:
             pass
-    return "", ensure_str(coalesce(*candidates))
+    return "", ensure_str(coalesce(*candidates)), None
 
 
 # ── MSG parsing ────────────────────────────────────────────────────────────────
-def read_msg_from_bytes(data: bytes, debug: bool = False) -> Dict[str, str]:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".msg") as tmp:
-        tmp.write(data); tmp_path = tmp.name
-    try:
-        msg = extract_msg.Message(tmp_path)
-
-        sender_display = ensure_str(getattr(msg, "sender", ""))
-        sender_email   = ensure_str(getattr(msg, "senderemail", ""))
+@st.cache_data(show_spinner=False, max_entries=200, ttl=3600)
+def read_msg_from_bytes(data: Union[bytes, BinaryIO], debug: bool = False, name: str = "") -> Dict[str, str]:
+    # Parse straight from memory; extract_msg/olefile accept file-like objects,
+    # so an uploaded buffer is handed over as-is instead of being copied out
+    if isinstance(data, (bytes, bytearray)):
+        data = io.BytesIO(data)
+    else:
+        data.seek(0)
+    # Context manager closes the OLE container and its stream cache on exit
+    with extract_msg.Message(data) as msg:
+        sender_display = _s(msg, "sender")
+        sender_email   = _s(msg, "senderemail")
         from_display, from_email = normalize_email_pair(sender_display, sender_email)
 
-        headers_raw = ensure_str(getattr(msg, "headers", "") or "")
-        body_text   = ensure_str(getattr(msg, "body", "") or "")
+        headers_raw = _s(msg, "headers")
+        body_text   = _s(msg, "body")
 
         to_val  = stringify_addrs(getattr(msg, "to", None))
         cc_val  = stringify_addrs(getattr(msg, "cc", None))
@@ -134,8 +187,8 @@ def read_msg_from_bytes(data: bytes, debug: bool = False) -> Dict[str, str]:
 
         att_names = []
         for att in (getattr(msg, "attachments", []) or []):
-            longn = ensure_str(getattr(att, "longFilename", "") or "")
-            shortn = ensure_str(getattr(att, "shortFilename", "") or "")
+            longn = _s(att, "longFilename")
+            shortn = _s(att, "shortFilename")
             att_names.append(longn or shortn)
         att_str = ", ".join(a for a in att_names if a)
 
@@ -148,21 +201,22 @@ def read_msg_from_bytes(data: bytes, debug: bool = False) -> Dict[str, str]:
         )
         cand_header = parse_date_from_headers(headers_raw)
         cand_body   = parse_date_from_body(body_text)
-        iso_date, raw_used = best_effort_parse_datetime(cand_date, cand_header, cand_body)
+        iso_date, raw_used, parsed_dt = best_effort_parse_datetime(cand_date, cand_header, cand_body)
 
         meta = {
-            "OriginalFilename": os.path.basename(tmp_path),
+            "OriginalFilename": ensure_str(name),
             "From": from_display,
             "FromEmail": from_email,
             "To": to_val,
             "Cc": cc_val,
             "Bcc": bcc_val,
-            "Subject": ensure_str(getattr(msg, "subject", "") or ""),
+            "Subject": _s(msg, "subject"),
             "Date": ensure_str(iso_date),
             "DateRaw": ensure_str(raw_used),
             "HeadersRaw": headers_raw,
             "Body": body_text,               # RAW body; we will display as-is
             "AttachmentNames": att_str,
+            "_dt": parsed_dt,  # reused by sort_key
         }
 
         if debug:
@@ -178,105 +232,149 @@ def read_msg_from_bytes(data: bytes, debug: bool = False) -> Dict[str, str]:
                 "iso": ensure_str(iso_date),
             }
         return meta
-    finally:
-        try: os.unlink(tmp_path)
-        except Exception: pass
 
 
 # ── Formatting (TXT/MD/PDF) ────────────────────────────────────────────────────
+_SEP = "=" * 78
+_REC_TEMPLATE = (
+    "{sep}\n"
+    "Email {i} of {n}\n"
+    "{sep}\n"
+    "From: {from_}\n"
+    "FromEmail: {from_email}\n"
+    "To: {to}\n"
+    "Cc: {cc}\n"
+    "Bcc: {bcc}\n"
+    "Subject: {subject}\n"
+    "Date: {date}\n"
+    "AttachmentNames: {atts}\n"
+    "\n"
+    "Headers:\n"
+    "{headers}\n"
+    "\n"
+    "Body:\n"
+    "{body}\n"
+)
+
 def format_record_txt(rec: Dict[str, str], idx: int, total: int) -> str:
-    sep = "=" * 78
-    body_raw = ensure_str(rec.get("Body", ""))
-    lines = [
-        sep,
-        f"Email {idx} of {total}",
-        sep,
-        f"From: {ensure_str(rec.get('From',''))}",
-        f"FromEmail: {ensure_str(rec.get('FromEmail',''))}",
-        f"To: {ensure_str(rec.get('To',''))}",
-        f"Cc: {ensure_str(rec.get('Cc',''))}",
-        f"Bcc: {ensure_str(rec.get('Bcc',''))}",
-        f"Subject: {ensure_str(rec.get('Subject',''))}",
-        f"Date: {ensure_str(rec.get('Date') or rec.get('DateRaw') or '')}",
-        f"AttachmentNames: {ensure_str(rec.get('AttachmentNames',''))}",
-        "",
-        "Headers:",
-        ensure_str(rec.get("HeadersRaw","")).strip(),
-        "",
-        "Body:",
-        body_raw.rstrip(),
-        "",
-    ]
-    return safe_join("\n", lines)
+    return _REC_TEMPLATE.format(
+        sep=_SEP, i=idx, n=total,
+        from_=ensure_str(rec.get('From','')),
+        from_email=ensure_str(rec.get('FromEmail','')),
+        to=ensure_str(rec.get('To','')),
+        cc=ensure_str(rec.get('Cc','')),
+        bcc=ensure_str(rec.get('Bcc','')),
+        subject=ensure_str(rec.get('Subject','')),
+        date=ensure_str(rec.get('Date') or rec.get('DateRaw') or ''),
+        atts=ensure_str(rec.get('AttachmentNames','')),
+        headers=ensure_str(rec.get('HeadersRaw','')).strip(),
+        body=ensure_str(rec.get('Body','')).rstrip(),
+    )
 
+@st.cache_data(show_spinner=False, max_entries=8, ttl=3600)
 def build_markdown(records: List[Dict[str, str]]) -> str:
-    parts = []
-    parts.append("# Email Export\n")
-    parts.append(f"_Total emails_: **{len(records)}**\n")
-    parts.append("---\n")
+    parts = [
+        "# Email Export\n",
+        f"_Total emails_: **{len(records)}**\n",
+        "---\n",
+    ]
     for i, r in enumerate(records, start=1):
-        parts.append(f"## Email {i}\n")
-        parts.append(f"**From:** {md_inline_escape(r.get('From',''))}  ")
-        if r.get("FromEmail"):
-            parts.append(f"**FromEmail:** `{ensure_str(r.get('FromEmail',''))}`  ")
-        parts.append(f"**To:** {md_inline_escape(r.get('To',''))}  ")
-        if r.get("Cc"):  parts.append(f"**Cc:** {md_inline_escape(r.get('Cc',''))}  ")
-        if r.get("Bcc"): parts.append(f"**Bcc:** {md_inline_escape(r.get('Bcc',''))}  ")
-        parts.append(f"**Subject:** {md_inline_escape(r.get('Subject',''))}  ")
-        parts.append(f"**Date:** `{ensure_str(r.get('Date') or r.get('DateRaw') or '')}`  ")
-        if r.get("AttachmentNames"):
-            parts.append(f"**Attachments:** {md_inline_escape(r.get('AttachmentNames',''))}  ")
-        if r.get('OriginalFilename'):
-            parts.append(f"**Source File:** `{ensure_str(r['OriginalFilename'])}`  ")
+        # Optional lines collapse to "" so each record is a single f-string
+        from_email = f"**FromEmail:** `{ensure_str(r['FromEmail'])}`  \n" if r.get("FromEmail") else ""
+        cc  = f"**Cc:** {md_inline_escape(r['Cc'])}  \n" if r.get("Cc") else ""
+        bcc = f"**Bcc:** {md_inline_escape(r['Bcc'])}  \n" if r.get("Bcc") else ""
+        atts = f"**Attachments:** {md_inline_escape(r['AttachmentNames'])}  \n" if r.get("AttachmentNames") else ""
+        src = f"**Source File:** `{ensure_str(r['OriginalFilename'])}`  \n" if r.get("OriginalFilename") else ""
 
         # Optional headers in a collapsible block if present
         headers = ensure_str(r.get("HeadersRaw","")).strip()
-        if headers:
-            parts.append("\n<details>\n<summary><strong>Headers</strong></summary>\n\n```text")
-            parts.append(headers)
-            parts.append("```\n</details>\n")
+        headers_block = (
+            f"\n<details>\n<summary><strong>Headers</strong></summary>\n\n```text\n"
+            f"{headers}\n"
+            f"```\n</details>\n\n"
+        ) if headers else ""
 
         # RAW body in a grey box (fenced code block)
-        parts.append("\n**Body**\n")
-        parts.append("```text")
-        parts.append(ensure_str(r.get("Body","")).rstrip())
-        parts.append("```")
-
-        parts.append('\n<div class="pagebreak"></div>\n')
-        parts.append("---\n")
-    return safe_join("\n", parts)
-
-def markdown_to_pdf(md_text: str) -> bytes:
-    html_body = markdown2.markdown(ensure_str(md_text), extras=["tables", "fenced-code-blocks"])
-    html_full = f"""
-<!DOCTYPE html>
-<html>
-<head>
-<meta charset="utf-8">
-<style>
-  @page {{ size: Letter; margin: 0.6in; }}
-  body {{ font-family: DejaVu Sans, Arial, Helvetica, sans-serif; font-size: 11pt; line-height: 1.35; }}
-  h1, h2, h3, h4 {{ margin: 0.4em 0 0.2em; }}
-  code, pre {{ font-family: "DejaVu Sans Mono", "Courier New", monospace; font-size: 10pt; white-space: pre-wrap; word-wrap: break-word; }}
-  pre {{ border: 1px solid #ddd; padding: 8px; border-radius: 4px; background: #fafafa; }}
-  .pagebreak {{ page-break-before: always; }}
-  details > summary {{ cursor: pointer; margin: 0.2em 0; }}
-  table {{ border-collapse: collapse; width: 100%; margin: 8px 0; font-size: 10pt; }}
-  th, td {{ border: 1px solid #ddd; padding: 4px 6px; vertical-align: top; }}
-  th {{ background: #f0f0f0; }}
-</style>
-</head>
-<body>
-{html_body}
-</body>
-</html>
-    """.strip()
+        parts.append(
+            f"## Email {i}\n\n"
+            f"**From:** {md_inline_escape(r.get('From',''))}  \n"
+            f"{from_email}"
+            f"**To:** {md_inline_escape(r.get('To',''))}  \n"
+            f"{cc}{bcc}"
+            f"**Subject:** {md_inline_escape(r.get('Subject',''))}  \n"
+            f"**Date:** `{ensure_str(r.get('Date') or r.get('DateRaw') or '')}`  \n"
+            f"{atts}{src}"
+            f"{headers_block}"
+            f"\n**Body**\n\n"
+            f"```text\n"
+            f"{ensure_str(r.get('Body','')).rstrip()}\n"
+            f"```\n"
+            f'\n<div class="pagebreak"></div>\n\n'
+            f"---\n"
+        )
+    return "\n".join(parts)
+
+# PDF styles are built once; ReportLab flowables only reference them
+_PDF_BASE = getSampleStyleSheet()
+_PDF_TITLE = ParagraphStyle("EmailTitle", parent=_PDF_BASE["Heading1"], spaceBefore=0)
+_PDF_HEADING = ParagraphStyle("EmailHeading", parent=_PDF_BASE["Heading2"])
+_PDF_META = ParagraphStyle("EmailMeta", parent=_PDF_BASE["BodyText"], fontSize=10, leading=13, spaceAfter=0)
+_PDF_LABEL = ParagraphStyle("EmailLabel", parent=_PDF_META, fontName="Helvetica-Bold", spaceBefore=8, spaceAfter=4)
+_PDF_PRE = ParagraphStyle(
+    "EmailPre", parent=_PDF_BASE["Code"], fontName="Courier", fontSize=9, leading=11,
+    backColor=colors.HexColor("#fafafa"), borderColor=colors.HexColor("#dddddd"),
+    borderWidth=0.5, borderPadding=6, leftIndent=6, rightIndent=6, spaceBefore=6, spaceAfter=10,
+)
+_PDF_PRE_WIDTH = 90  # Courier 9pt across a Letter page with 0.6in margins
+_PDF_PAGE = dict(pagesize=letter, title="Email Export",
+                 leftMargin=0.6 * inch, rightMargin=0.6 * inch,
+                 topMargin=0.6 * inch, bottomMargin=0.6 * inch)
+
+def _pdf_meta(label: str, value, mono: bool = False) -> Paragraph:
+    v = xml_escape(ensure_str(value))
+    if mono: v = f'<font face="Courier">{v}</font>'
+    return Paragraph(f"<b>{label}:</b> {v}", _PDF_META)
+
+@st.cache_data(show_spinner=False, max_entries=8, ttl=3600)
+def build_pdf(records: List[Dict[str, str]]) -> bytes:
+    story = [
+        Paragraph("Email Export", _PDF_TITLE),
+        Paragraph(f"<i>Total emails</i>: <b>{len(records)}</b>", _PDF_META),
+    ]
+    for i, r in enumerate(records, start=1):
+        story.append(Paragraph(f"Email {i}", _PDF_HEADING))
+        story.append(_pdf_meta("From", r.get("From", "")))
+        if r.get("FromEmail"): story.append(_pdf_meta("FromEmail", r["FromEmail"], mono=True))
+        story.append(_pdf_meta("To", r.get("To", "")))
+        if r.get("Cc"):  story.append(_pdf_meta("Cc", r["Cc"]))
+        if r.get("Bcc"): story.append(_pdf_meta("Bcc", r["Bcc"]))
+        story.append(_pdf_meta("Subject", r.get("Subject", "")))
+        story.append(_pdf_meta("Date", r.get("Date") or r.get("DateRaw") or "", mono=True))
+        if r.get("AttachmentNames"): story.append(_pdf_meta("Attachments", r["AttachmentNames"]))
+        if r.get("OriginalFilename"): story.append(_pdf_meta("Source File", r["OriginalFilename"], mono=True))
+
+        headers = ensure_str(r.get("HeadersRaw", "")).strip()
+        if headers:
+            story.append(Paragraph("Headers", _PDF_LABEL))
+            story.append(Preformatted(headers, _PDF_PRE, maxLineLength=_PDF_PRE_WIDTH))
+
+        # RAW body in a grey box
+        story.append(Paragraph("Body", _PDF_LABEL))
+        story.append(Preformatted(ensure_str(r.get("Body", "")).rstrip() or " ", _PDF_PRE,
+                                  maxLineLength=_PDF_PRE_WIDTH))
+        if i < len(records):
+            story.append(PageBreak())
+
     out = io.BytesIO()
-    pisa.CreatePDF(io.StringIO(ensure_str(html_full)), dest=out)
+    doc = SimpleDocTemplate(out, **_PDF_PAGE)
+    doc.build(story)
     return out.getvalue()
 
 def sort_key(rec: Dict[str, str]):
-    dt = try_parse_datetime(ensure_str(rec.get("Date") or rec.get("DateRaw")))
+    if "_dt" in rec:
+        dt = rec["_dt"]
+    else:
+        dt = try_parse_datetime(ensure_str(rec.get("Date") or rec.get("DateRaw")))
     subj = ensure_str(rec.get("Subject", ""))
     fn = ensure_str(rec.get("OriginalFilename", ""))
     return (0 if dt else 1, dt or datetime.min, subj, fn)
@@ -289,7 +387,7 @@ with st.expander("Options", expanded=False):
     include_headers = st.checkbox("Include raw headers", value=True)
     include_body = st.checkbox("Include body", value=True)
     show_date_debug = st.checkbox("Show date debug info", value=False)
-    make_pdf = st.checkbox("Prepare PDF export (Markdown → PDF)", value=True)
+    make_pdf = st.checkbox("Prepare Markdown + PDF export", value=True)
 
 uploaded = st.file_uploader(
     "Drop .msg files here", type=["msg"], accept_multiple_files=True,
@@ -303,32 +401,67 @@ if uploaded:
     st.info(f"Loaded {len(uploaded)} file(s). Parsing locally...")
     records, errors = [], []
 
-    for f in uploaded:
-        try:
-            rec = read_msg_from_bytes(f.read(), debug=show_date_debug)
-            rec["OriginalFilename"] = ensure_str(f.name)
-
-            # Respect toggles
-            if not include_headers:
-                rec["HeadersRaw"] = ""
-            if not include_body:
-                rec["Body"] = ""
-
-            records.append(rec)
-        except Exception as e:
-            errors.append(f"{f.name}: {e}")
+    # UploadedFile is an in-memory BytesIO; each worker gets exclusive use of one
+    # buffer, so hand it over directly rather than materializing a bytes copy
+    payloads = [(ensure_str(f.name), f) for f in uploaded]
+    for _, f in payloads:
+        f.seek(0)  # st.cache_data hashes BytesIO by content *and* position
+
+    # Workers call the cached parser, which needs the session's script context
+    ctx = get_script_run_ctx()
+    results: List[Optional[Dict[str, str]]] = [None] * len(payloads)
+    failures: Dict[int, str] = {}
+
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 4),
+                            initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)) as ex:
+        futures = {ex.submit(read_msg_from_bytes, data, show_date_debug, name): i
+                   for i, (name, data) in enumerate(payloads)}
+        for done, fut in enumerate(as_completed(futures), start=1):
+            i = futures[fut]
+            try:
+                results[i] = fut.result()
+            except Exception as e:
+                failures[i] = f"{payloads[i][0]}: {e}"
+            if done % 50 == 0:
+                gc.collect()  # keep RSS flat on large batches
+
+    # Preserve upload order regardless of completion order
+    for i in range(len(payloads)):
+        if i in failures:
+            errors.append(failures[i])
+            continue
+        rec = results[i]
+
+        # Respect toggles
+        if not include_headers:
+            rec["HeadersRaw"] = ""
+        if not include_body:
+            rec["Body"] = ""
+
+        records.append(rec)
 
     if errors:
         st.warning("Some files could not be parsed:")
         for e in errors:
             st.code(e)
 
-    ordered = sorted(records, key=sort_key, reverse=("desc" in sort_choice.lower())) \
-        if sort_choice.startswith("By Date") else records
+    if sort_choice.startswith("By Date"):
+        # Decorate once, sort on the precomputed key, undecorate
+        decorated = [(sort_key(r), r) for r in records]
+        decorated.sort(key=operator.itemgetter(0), reverse=("desc" in sort_choice.lower()))
+        ordered = [r for _, r in decorated]
+    else:
+        ordered = records
 
     total = len(ordered)
-    combined_parts = [format_record_txt(r, i, total) for i, r in enumerate(ordered, start=1)]
-    combined_text = ensure_str(safe_join("\n", combined_parts)).encode("utf-8")
+    # Encode each record as it is formatted and join the bytes once, rather than
+    # holding the list of parts, the joined str and its encoded copy all at once
+    first_section = format_record_txt(ordered[0], 1, total) if ordered else ""  # reused by the preview
+    combined_text = b"\n".join(chain(
+        (first_section.encode("utf-8"),),
+        (format_record_txt(r, i, total).encode("utf-8")
+         for i, r in enumerate(islice(ordered, 1, None), start=2)),
+    ))
 
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     out_name = safe_filename(f"merged_emails_{ts}.txt")
@@ -344,30 +477,41 @@ if uploaded:
 
     # Markdown + PDF (with RAW body in grey box)
     if make_pdf and ordered:
-        md_doc = build_markdown(ordered)
-        st.download_button(
-            "Download Markdown",
-            data=md_doc.encode("utf-8"),
-            file_name=out_name.replace(".txt", ".md"),
-            mime="text/markdown",
-            use_container_width=True,
-        )
-        try:
-            pdf_bytes = markdown_to_pdf(md_doc)
+        # Both exports are built only on request (cached per data set). The request
+        # is remembered for this exact batch + options, so the downloads survive
+        # reruns but a new upload or option change needs a fresh click.
+        batch_sig = (tuple(f.file_id for f in uploaded), sort_choice, include_headers, include_body)
+        if st.session_state.get("exports_requested_for") != batch_sig:
+            st.button("Generate Markdown + PDF", use_container_width=True,
+                      on_click=lambda: st.session_state.update(exports_requested_for=batch_sig))
+        else:
             st.download_button(
-                "Download PDF",
-                data=pdf_bytes,
-                file_name=out_name.replace(".txt", ".pdf"),
-                mime="application/pdf",
+                "Download Markdown",
+                data=build_markdown(ordered).encode("utf-8"),
+                file_name=out_name.replace(".txt", ".md"),
+                mime="text/markdown",
                 use_container_width=True,
             )
-        except Exception as e:
-            st.warning(f"PDF generation failed: {e}")
+            try:
+                with st.spinner("Rendering PDF..."):
+                    pdf_bytes = build_pdf(ordered)
+                st.download_button(
+                    "Download PDF",
+                    data=pdf_bytes,
+                    file_name=out_name.replace(".txt", ".pdf"),
+                    mime="application/pdf",
+                    use_container_width=True,
+                )
+            except Exception as e:
+                st.warning(f"PDF generation failed: {e}")
+    else:
+        st.session_state.pop("exports_requested_for", None)
 
     with st.expander("Preview first email section"):
         if ordered:
-            st.text(format_record_txt(ordered[0], 1, total)[:5000])
+            st.text(first_section[:5000])
         else:
             st.write("No records parsed yet.")
 else:
+    st.session_state.pop("exports_requested_for", None)
     st.write("Select one or more .msg files to enable conversion.")